@@ -15,25 +15,49 @@ Environment variables:
 - HTTP_HOST (default: 0.0.0.0)
 - HTTP_PORT (default: 8080)
 - IMAGE_REFRESH_MS (default: 2000)  # used by the web page JS auto-reload
+- SSE_DEBOUNCE_MS (default: 200)  # minimum interval between SSE update events
+- ACCEPT_BASE64 (default: 0)  # set to 1 to also accept base64-encoded JPEG payloads
 """
 
 import os
+import re
+import sys
 import logging
 import threading
 import time
-import base64
 import requests
 import queue
 
 from flask import (
     Flask,
     Response,
-    render_template_string,
-    jsonify,
     stream_with_context,
     request,
 )
+from jinja2 import Template
 import paho.mqtt.client as mqtt
+from requests.adapters import HTTPAdapter
+
+# pybase64 mirrors the stdlib API but decodes with SIMD; fall back when it
+# is not installed (e.g. the Debian-packaged container image).
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# orjson serialises the /gallery and /status payloads in C; fall back to the
+# stdlib encoder when it is not installed.
+try:
+    import orjson
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:
+    import json
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
 
 # Configuration from env
 MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
@@ -52,6 +76,8 @@ MQTT_CA_CERT = os.getenv("MQTT_CA_CERT", None)
 HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
 HTTP_PORT = int(os.getenv("HTTP_PORT", "8080"))
 IMAGE_REFRESH_MS = int(os.getenv("IMAGE_REFRESH_MS", "2000"))
+SSE_DEBOUNCE_MS = max(0, int(os.getenv("SSE_DEBOUNCE_MS", "200")))
+ACCEPT_BASE64 = os.getenv("ACCEPT_BASE64", "0") == "1"
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 _log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
@@ -62,19 +88,80 @@ logger.setLevel(_log_level)
 app = Flask(__name__)
 
 # Shared state for last image
-# Store latest image for each (cam, object): {(cam, object): (image_bytes, timestamp)}
+# Store latest image for each (cam, object): {(cam, object): (image_bytes, ts_ms)}
+# The dict is never mutated once published: writers build a copy and rebind
+# the global, so readers iterate a stable snapshot without any lock.
 _latest_images = {}
-_lock = threading.RLock()
+# Serialises writers (MQTT worker and URL fetcher) so no update is lost
+_lock = threading.Lock()
+# /gallery response body for a given _latest_images dict: (images, json_body)
+_gallery_cache = (None, None)
+
+# JPEG start-of-image marker; checked with startswith to avoid a slice copy
+_JPEG_MAGIC = b"\xff\xd8\xff"
+
+# Cheap sniff for base64 payloads: only the head of the payload is checked so
+# binary data bails out before a full decode pass.
+_B64_HEAD_RE = re.compile(rb"[A-Za-z0-9+/=]+")
+_B64_SNIFF_LEN = 64
+
+# SSE: version counter bumped on every update; clients wait on the shared
+# condition until it advances, so bursts between wake-ups collapse into one event
+_sse_version = 0
+_sse_cv = threading.Condition()
+# Set by stores; the notifier thread turns bursts of sets into one SSE update
+_pending_notify = threading.Event()
+
+# Pooled HTTP session for URL payloads: keep-alive and TLS session reuse
+_http_session = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_http_session.mount("http://", _http_adapter)
+_http_session.mount("https://", _http_adapter)
+
+# URL payloads are fetched off the MQTT network thread: queue of (url, cam, obj)
+_fetch_q = queue.Queue(maxsize=32)
+
+# MQTT messages handed from the paho network thread to the worker: {topic: payload}.
+# A snapshot topic maps to one (cam, object), so a newer payload replaces the
+# pending one for the same key without evicting other cameras.
+_pending_msgs = {}
+_pending_msgs_lock = threading.Lock()
+_pending_msgs_event = threading.Event()
+
+
+def fetch_jpeg_from_url(url: str):
+    """
+    Fetch url with the shared session and return the response body.
+    Return None if the request fails.
+    """
+    try:
+        resp = _http_session.get(url, timeout=(1.0, 3.0), stream=False)
+        resp.raise_for_status()
+        return resp.content
+    except Exception as e:
+        logger.warning("Could not fetch image from %s: %s", url, e)
+        return None
 
-# SSE: list of queues for connected clients
-_sse_clients = []
-_sse_clients_lock = threading.Lock()
+
+def publish_image(cam: str, obj: str, img: bytes):
+    """
+    Publish img as the latest image for (cam, obj) and schedule an SSE update.
+    """
+    global _latest_images
+    with _lock:
+        images = _latest_images.copy()
+        images[(cam, obj)] = (img, time.time_ns() // 1_000_000)
+        _latest_images = images
+    _pending_notify.set()
 
 
 def store_image_for_topic(candidate_bytes: bytes, cam: str, obj: str) -> bool:
     """
-    Store the image for (cam, obj) if candidate_bytes is a jpeg (raw, base64, or URL).
-    Return True if stored, False otherwise.
+    Store the image for (cam, obj) if candidate_bytes is a jpeg (raw, URL, or
+    base64 when ACCEPT_BASE64 is enabled).
+    URL payloads are queued for the fetch worker.
+    Return True if the payload was recognized (stored, queued, or a URL dropped
+    because the fetch queue is full), False otherwise.
     """
     if not candidate_bytes:
         return False
@@ -89,46 +176,48 @@ def store_image_for_topic(candidate_bytes: bytes, cam: str, obj: str) -> bool:
     except Exception:
         as_str = None
     if as_str and as_str.strip().lower().startswith("http"):
-        img = fetch_jpeg_from_url(as_str.strip())
-        if img and img[:3] == b"\xff\xd8\xff":
-            with _lock:
-                _latest_images[(cam, obj)] = (img, time.time())
-            logger.info(
-                "Stored JPEG fetched from URL for %s/%s (size=%d)", cam, obj, len(img)
-            )
-            notify_sse_clients()
-            return True
-        else:
-            logger.warning("URL did not yield a valid JPEG: %s", as_str)
-            return False
+        try:
+            _fetch_q.put_nowait((as_str.strip(), cam, obj))
+        except queue.Full:
+            # A valid URL payload; the drop is already logged, so don't report
+            # it as an unrecognized JPEG as well
+            logger.warning("URL fetch queue full, dropping %s", as_str)
+        return True
 
     # If the payload already looks like JPEG bytes:
-    if candidate_bytes[:3] == b"\xff\xd8\xff":
-        with _lock:
-            _latest_images[(cam, obj)] = (candidate_bytes, time.time())
+    if candidate_bytes.startswith(_JPEG_MAGIC):
+        publish_image(cam, obj, candidate_bytes)
         logger.info(
             "Stored raw JPEG image for %s/%s (size=%d)", cam, obj, len(candidate_bytes)
         )
-        notify_sse_clients()
         return True
 
+    # Base64 payloads are opt-in: Frigate snapshot topics carry raw JPEG
+    if not ACCEPT_BASE64:
+        logger.debug(
+            "Skipping base64 decode for %s/%s (set ACCEPT_BASE64=1 to enable)",
+            cam,
+            obj,
+        )
+        return False
+
     # Try base64 decode (payload may be str or bytes)
     try:
         if isinstance(candidate_bytes, str):
             cand = candidate_bytes.encode("utf-8")
         else:
             cand = candidate_bytes
+        if len(cand) % 4 or not _B64_HEAD_RE.fullmatch(cand, 0, _B64_SNIFF_LEN):
+            return False
         decoded = base64.b64decode(cand, validate=True)
-        if decoded[:3] == b"\xff\xd8\xff":
-            with _lock:
-                _latest_images[(cam, obj)] = (decoded, time.time())
+        if decoded.startswith(_JPEG_MAGIC):
+            publish_image(cam, obj, decoded)
             logger.info(
                 "Stored base64-decoded JPEG image for %s/%s (size=%d)",
                 cam,
                 obj,
                 len(decoded),
             )
-            notify_sse_clients()
             return True
     except Exception:
         pass
@@ -150,22 +239,57 @@ def on_connect(client, userdata, flags, rc):
 
 
 def on_message(client, userdata, msg):
-    logger.debug("MQTT message on %s (len=%d)", msg.topic, len(msg.payload))
-    # Parse topic: frigate/<cam>/<object>/snapshot
-    parts = msg.topic.split("/")
-    if len(parts) == 4 and parts[0] == "frigate" and parts[3] == "snapshot":
-        cam = parts[1]
-        obj = parts[2]
-        ok = store_image_for_topic(msg.payload, cam, obj)
-        if not ok:
-            logger.warning(
-                "Received message on %s but it is not a recognizable JPEG", msg.topic
-            )
-    else:
+    # Keep the paho callback O(1): hand off to the worker thread
+    with _pending_msgs_lock:
+        _pending_msgs[msg.topic] = msg.payload
+    _pending_msgs_event.set()
+
+
+def process_message(topic, payload):
+    logger.debug("MQTT message on %s (len=%d)", topic, len(payload))
+    # Parse topic: frigate/<cam>/<object>/snapshot without splitting into a list
+    slash = -1
+    if topic.startswith("frigate/") and topic.endswith("/snapshot"):
+        mid = topic[8:-9]
+        slash = mid.find("/")
+        if slash >= 0 and mid.find("/", slash + 1) >= 0:
+            slash = -1
+    if slash < 0:
         logger.debug(
             "Ignoring message on topic %s (does not match frigate/<cam>/<object>/snapshot)",
-            msg.topic,
+            topic,
         )
+        return
+    # Intern the few camera/object names so dict keys share cached hashes
+    cam = sys.intern(mid[:slash])
+    obj = sys.intern(mid[slash + 1 :])
+    ok = store_image_for_topic(payload, cam, obj)
+    if not ok:
+        logger.warning(
+            "Received message on %s but it is not a recognizable JPEG", topic
+        )
+
+
+def message_worker_loop():
+    global _pending_msgs
+    while True:
+        _pending_msgs_event.wait()
+        _pending_msgs_event.clear()
+        # Take the whole batch; messages arriving meanwhile set the event again
+        with _pending_msgs_lock:
+            batch = _pending_msgs
+            _pending_msgs = {}
+        for topic, payload in batch.items():
+            try:
+                process_message(topic, payload)
+            except Exception:
+                logger.exception("Error processing message on %s", topic)
+
+
+def start_message_worker():
+    t = threading.Thread(target=message_worker_loop, name="mqtt-worker", daemon=True)
+    t.start()
+    return t
 
 
 def start_mqtt_client():
@@ -210,10 +334,8 @@ def start_mqtt_client():
     return client
 
 
-@app.route("/")
-def index():
-    # Gallery page: show latest images grouped by camera/object
-    html = """
+# Gallery page: show latest images grouped by camera/object
+_INDEX_HTML = """
     <!doctype html>
     <html>
       <head>
@@ -325,7 +447,7 @@ def index():
               const isLatest = latestKey && (entry.cam + '|' + entry.obj) === latestKey && entry.ts === latestTs;
               html += `<div class="object-card${isLatest ? ' latest-image' : ''}">
                 <img src="/image/${encodeURIComponent(entry.cam)}/${encodeURIComponent(entry.obj)}.jpg?ts=${entry.ts}" alt="No image" />
-                <div class="object-label">Object: <b>${entry.obj}</b><br><span style='font-size:0.85em;color:#888'>${new Date(entry.ts*1000).toLocaleString()}</span></div>
+                <div class="object-label">Object: <b>${entry.obj}</b><br><span style='font-size:0.85em;color:#888'>${new Date(entry.ts).toLocaleString()}</span></div>
               </div>`;
             }
             html += "</div></div>";
@@ -359,55 +481,74 @@ def index():
       </body>
     </html>
     """
-    return render_template_string(html, topic=MQTT_TOPIC)
-    return render_template_string(
-        html, topic=MQTT_TOPIC, ts=ts, human_ts=human_ts, refresh_ms=IMAGE_REFRESH_MS
-    )
+# The only dynamic value is the topic, so render the page once at import
+_INDEX_BYTES = (
+    Template(_INDEX_HTML, autoescape=True).render(topic=MQTT_TOPIC).encode("utf-8")
+)
+
+
+def json_response(obj):
+    return Response(json_dumps(obj), mimetype="application/json")
+
+
+@app.route("/")
+def index():
+    return Response(_INDEX_BYTES, mimetype="text/html")
 
 
 @app.route("/image/<cam>/<obj>.jpg")
 def image(cam, obj):
-    with _lock:
-        key = (cam, obj)
-        entry = _latest_images.get(key)
-        if not entry:
-            return Response(status=204)
-        img, ts = entry
-    return Response(
-        img,
-        mimetype="image/jpeg",
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "X-Image-Timestamp": str(ts),
-        },
-    )
+    entry = _latest_images.get((cam, obj))
+    if not entry:
+        return Response(status=204)
+    img, ts = entry
+    # The timestamp identifies the snapshot, so let the browser revalidate
+    # and skip re-sending the JPEG when nothing new has arrived
+    etag = f'"{ts}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Image-Timestamp": str(ts),
+    }
+    # Weak comparison, as If-None-Match requires; also handles lists and "*"
+    if request.if_none_match.contains_weak(str(ts)):
+        return Response(status=304, headers=headers)
+    return Response(img, mimetype="image/jpeg", headers=headers)
 
 
 @app.route("/gallery")
 def gallery():
-    with _lock:
-        images = []
-        latest = None
-        for (cam, obj), (img, ts) in _latest_images.items():
-            images.append(
-                {
-                    "cam": cam,
-                    "obj": obj,
-                    "ts": int(ts),
-                }
-            )
-            if latest is None or ts > latest["ts"]:
-                latest = {"cam": cam, "obj": obj, "ts": int(ts)}
-    return jsonify({"images": images, "topic": MQTT_TOPIC, "latest": latest})
+    global _gallery_cache
+    # Every store rebinds _latest_images, so the dict identity tells whether
+    # the cached body is still current
+    snapshot = _latest_images
+    cached_snapshot, cached_body = _gallery_cache
+    if cached_snapshot is snapshot:
+        return Response(cached_body, mimetype="application/json")
+    images = []
+    latest = None
+    for (cam, obj), (img, ts) in snapshot.items():
+        images.append(
+            {
+                "cam": cam,
+                "obj": obj,
+                "ts": ts,
+            }
+        )
+        if latest is None or ts > latest["ts"]:
+            latest = {"cam": cam, "obj": obj, "ts": ts}
+    body = json_dumps({"images": images, "topic": MQTT_TOPIC, "latest": latest})
+    _gallery_cache = (snapshot, body)
+    return Response(body, mimetype="application/json")
 
 
 @app.route("/status")
 def status():
-    with _lock:
-        count = len(_latest_images)
-        cams = sorted(set(cam for (cam, obj) in _latest_images))
-        objects = sorted(set(obj for (cam, obj) in _latest_images))
-    return jsonify(
+    images = _latest_images
+    count = len(images)
+    cams = sorted(set(cam for (cam, obj) in images))
+    objects = sorted(set(obj for (cam, obj) in images))
+    return json_response(
         {
             "topic": MQTT_TOPIC,
             "num_images": count,
@@ -421,47 +562,85 @@ def status():
 @app.route("/events")
 def sse_events():
     def gen():
-        q = queue.Queue()
-        with _sse_clients_lock:
-            _sse_clients.append(q)
-        try:
-            # Send an initial event so the client can update immediately
+        last_seen = _sse_version
+        # Send an initial event so the client can update immediately
+        yield "data: update\n\n"
+        while True:
+            # Block until a new event is available
+            with _sse_cv:
+                _sse_cv.wait_for(lambda: _sse_version != last_seen)
+                last_seen = _sse_version
             yield "data: update\n\n"
-            while True:
-                # Block until a new event is available
-                q.get()
-                yield "data: update\n\n"
-        except GeneratorExit:
-            pass
-        finally:
-            with _sse_clients_lock:
-                if q in _sse_clients:
-                    _sse_clients.remove(q)
 
     return Response(stream_with_context(gen()), mimetype="text/event-stream")
 
 
 def notify_sse_clients():
-    with _sse_clients_lock:
-        for q in list(_sse_clients):
-            try:
-                q.put_nowait(True)
-            except Exception:
-                pass
+    global _sse_version
+    with _sse_cv:
+        _sse_version += 1
+        _sse_cv.notify_all()
+
+
+def url_fetch_loop():
+    # Fetch queued URL payloads so slow HTTP never blocks the MQTT network thread
+    while True:
+        url, cam, obj = _fetch_q.get()
+        img = fetch_jpeg_from_url(url)
+        if img and img.startswith(_JPEG_MAGIC):
+            publish_image(cam, obj, img)
+            logger.info(
+                "Stored JPEG fetched from URL for %s/%s (size=%d)", cam, obj, len(img)
+            )
+        else:
+            logger.warning("URL did not yield a valid JPEG: %s", url)
 
 
-def main():
+def start_url_fetcher():
+    t = threading.Thread(target=url_fetch_loop, name="url-fetcher", daemon=True)
+    t.start()
+    return t
+
+
+def sse_notifier_loop():
+    # Coalesce stores arriving within SSE_DEBOUNCE_MS into a single wake-up
+    while True:
+        _pending_notify.wait()
+        time.sleep(SSE_DEBOUNCE_MS / 1000.0)
+        _pending_notify.clear()
+        notify_sse_clients()
+
+
+def start_sse_notifier():
+    t = threading.Thread(target=sse_notifier_loop, name="sse-notifier", daemon=True)
+    t.start()
+    return t
+
+
+def start_services():
+    """
+    Start the background threads and the MQTT client.
+    Shared by main() and the WSGI entry point (wsgi.py). Return the MQTT client.
+    """
     # Print startup info
     logger.info("Starting mqtt image server")
     logger.info("MQTT topic subscription string: %s", MQTT_TOPIC)
     # Log the effective log level using the numeric _log_level
     logger.info("Log level: %s", logging.getLevelName(_log_level))
 
+    start_sse_notifier()
+    start_url_fetcher()
+    start_message_worker()
+
     # Start MQTT client (will subscribe in on_connect)
-    client = start_mqtt_client()
+    return start_mqtt_client()
+
+
+def main():
+    client = start_services()
     try:
         logger.info("Starting Flask HTTP server on %s:%d", HTTP_HOST, HTTP_PORT)
-        # Flask's built-in server is fine for small local use. Use gunicorn/uvicorn for production.
+        # Flask's built-in server is fine for small local use. Use wsgi.py with gunicorn for production.
         app.run(host=HTTP_HOST, port=HTTP_PORT, threaded=True)
     except Exception as e:
         logger.exception("Unhandled exception in web server: %s", e)
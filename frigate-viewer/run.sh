@@ -21,10 +21,12 @@ HTTP_HOST="${HTTP_HOST:-0.0.0.0}"
 HTTP_PORT="${HTTP_PORT:-8080}"
 LOG_LEVEL=DEBUG
 IMAGE_REFRESH_MS="${IMAGE_REFRESH_MS:-2000}"
+ACCEPT_BASE64="${ACCEPT_BASE64:-0}"
+SSE_DEBOUNCE_MS="${SSE_DEBOUNCE_MS:-200}"
 
 # Export for the Python app to read
 export MQTT_BROKER_HOST MQTT_BROKER_PORT MQTT_USERNAME MQTT_PASSWORD MQTT_TOPIC
-export HTTP_HOST HTTP_PORT IMAGE_REFRESH_MS
+export HTTP_HOST HTTP_PORT IMAGE_REFRESH_MS ACCEPT_BASE64 SSE_DEBOUNCE_MS
 
 # Helper to mask sensitive values when printing
 _mask() {
@@ -45,6 +47,8 @@ printf "  MQTT_TOPIC       = %s\n" "$MQTT_TOPIC"
 printf "  HTTP_HOST        = %s\n" "$HTTP_HOST"
 printf "  HTTP_PORT        = %s\n" "$HTTP_PORT"
 printf "  IMAGE_REFRESH_MS = %s\n" "$IMAGE_REFRESH_MS"
+printf "  ACCEPT_BASE64    = %s\n" "$ACCEPT_BASE64"
+printf "  SSE_DEBOUNCE_MS  = %s\n" "$SSE_DEBOUNCE_MS"
 printf "\n"
 
 # Choose python executable (prefer python3)
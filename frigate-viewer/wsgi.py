@@ -0,0 +1,14 @@
+"""
+WSGI entry point for running the viewer under a production server, e.g.:
+
+    gunicorn -k gthread --threads 16 --workers 1 --bind 0.0.0.0:8080 wsgi:app
+
+Use a single worker: the latest images live in process memory, so multiple
+workers would each hold their own MQTT subscription and image store.
+Every connected browser keeps one thread busy with the /events stream, so
+size --threads for the expected number of viewers plus image requests.
+"""
+
+from app import app, start_services
+
+mqtt_client = start_services()